@@ -11,6 +11,7 @@ import os
 import socket
 import time
 import threading
+from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import AsyncIterator
 
@@ -22,7 +23,16 @@ from fastapi.templating import Jinja2Templates
 
 BASE_DIR = Path(__file__).parent
 
-app = FastAPI(title="Spotify → YouTube Music")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Release long-lived clients held by the backend modules
+    from backend.spotify import shutdown
+    await shutdown()
+
+
+app = FastAPI(title="Spotify → YouTube Music", lifespan=lifespan)
 
 # Static files & templates
 app.mount("/static", StaticFiles(directory=BASE_DIR / "static"), name="static")
@@ -129,10 +139,10 @@ async def convert(url: str):
     from backend.convert import convert_stream
     from backend.ytmusic import get_ytmusic
 
-    def _sse_err(msg: str) -> str:
-        return f"data: {json.dumps({'type': 'error', 'message': msg})}\n\n"
+    def _sse_err(msg: str) -> bytes:
+        return f"data: {json.dumps({'type': 'error', 'message': msg})}\n\n".encode()
 
-    async def event_generator() -> AsyncIterator[str]:
+    async def event_generator() -> AsyncIterator[bytes]:
         global _auth_validated_at
 
         # Pre-flight: auth file present?
@@ -163,6 +173,9 @@ async def convert(url: str):
         try:
             async for chunk in convert_stream(url, yt):
                 yield chunk
+                # Hand control back to the loop so each frame is flushed to the
+                # socket instead of coalescing with a burst of later ones
+                await asyncio.sleep(0)
         except asyncio.CancelledError:
             pass  # client disconnected
 
@@ -180,38 +193,43 @@ async def convert(url: str):
 # Entry point
 # ──────────────────────────────────────────────────────────────────────────────
 
-def _find_port(start: int = 3000, attempts: int = 10) -> int:
-    for port in range(start, start + attempts):
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            try:
-                s.bind(("127.0.0.1", port))
-                return port
-            except OSError:
-                continue
-    raise RuntimeError(f"No free port found between {start}–{start + attempts - 1}")
-
+def _bind_socket(preferred: int = 3000) -> socket.socket:
+    """
+    Bind the server socket: `preferred` if nothing else is bound to it,
+    otherwise whatever port the OS assigns. The bound socket is handed straight
+    to uvicorn, so nothing can grab the port between choosing it and serving
+    on it.
 
-PORT = _find_port()
+    No SO_REUSEADDR: on macOS it lets a 127.0.0.1 bind succeed alongside
+    another process listening on *:3000 (e.g. a Node dev server).
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.bind(("127.0.0.1", preferred))
+    except OSError:
+        sock.bind(("127.0.0.1", 0))
+    return sock
 
 
-def _open_browser():
+def _open_browser(port: int):
     import time, webbrowser
     time.sleep(1.2)  # wait for server to be ready
-    webbrowser.open(f"http://localhost:{PORT}")
+    webbrowser.open(f"http://localhost:{port}")
 
 
 if __name__ == "__main__":
-    print(f"  →  Starting on http://localhost:{PORT}")
-    thread = threading.Thread(target=_open_browser, daemon=True)
+    sock = _bind_socket()
+    port = sock.getsockname()[1]
+    print(f"  →  Starting on http://localhost:{port}")
+    thread = threading.Thread(target=_open_browser, args=(port,), daemon=True)
     thread.start()
 
+    server = uvicorn.Server(uvicorn.Config(
+        "app:app",
+        reload=False,
+        log_level="warning",
+    ))
     try:
-        uvicorn.run(
-            "app:app",
-            host="127.0.0.1",
-            port=PORT,
-            reload=False,
-            log_level="warning",
-        )
+        server.run(sockets=[sock])
     except KeyboardInterrupt:
         print("\n\n  Stopped. Bye!\n")
@@ -16,24 +16,86 @@ from __future__ import annotations
 import asyncio
 import json
 import os
+import re
 import sys
+import time
 from pathlib import Path
 
 HEADERS_FILE = "headers_auth.json"
 
 _AUTH_COOKIES = ("SAPISID", "__Secure-3PAPISID", "SSID")
 
+try:
+    from ytmusicapi.exceptions import YTMusicServerError, YTMusicUserError
+except ImportError:  # ytmusicapi < 1.8 raises plain Exceptions
+    YTMusicServerError = YTMusicUserError = None
+
+# YTMusicServerError carries no status attribute, only this message prefix
+_SERVER_STATUS_RE = re.compile(r"Server returned HTTP (\d{3})")
+_AUTH_ERROR_MARKERS = ("401", "403", "Unauthorized", "UNAUTHENTICATED")
+
+_3PAPISID_RE = re.compile(r"(?:^|;)\s*__Secure-3PAPISID=([^;]*)")
+_SAPISID_RE = re.compile(r"(?:^|;)\s*SAPISID=([^;]*)")
+
 # True while a Playwright browser window is open for sign-in
 playwright_active: bool = False
 
+# is_connected() result, reused for _CONN_TTL seconds. Every write/unlink of
+# HEADERS_FILE in this module clears it, so the TTL only bounds external edits.
+_CONN_TTL = 5.0  # seconds
+_conn_cache: tuple[float, bool] | None = None  # (checked_at, connected)
+
 
 # ──────────────────────────────────────────────────────────────────────────────
 # Public API
 # ──────────────────────────────────────────────────────────────────────────────
 
 def is_connected() -> bool:
-    p = Path(HEADERS_FILE)
-    return p.exists() and p.stat().st_size > 10
+    global _conn_cache
+    now = time.monotonic()
+    if _conn_cache and now - _conn_cache[0] < _CONN_TTL:
+        return _conn_cache[1]
+    try:
+        connected = os.stat(HEADERS_FILE).st_size > 10
+    except OSError:
+        connected = False
+    _conn_cache = (now, connected)
+    return connected
+
+
+def _invalidate_conn_cache() -> None:
+    global _conn_cache
+    _conn_cache = None
+
+
+def is_auth_error(exc: BaseException) -> bool:
+    """True if exc means the YT Music credentials were rejected (HTTP 401/403)."""
+    if YTMusicServerError is not None:
+        if isinstance(exc, YTMusicServerError):
+            m = _SERVER_STATUS_RE.match(str(exc))
+            return bool(m) and m.group(1) in ("401", "403")
+        if isinstance(exc, YTMusicUserError):
+            return False
+    status = getattr(getattr(exc, "response", None), "status_code", None)
+    if status is not None:
+        return status in (401, 403)
+    # Unknown exception type — fall back to scanning the message
+    msg = str(exc)
+    return any(marker in msg for marker in _AUTH_ERROR_MARKERS)
+
+
+def invalidate_on_auth_error(exc: BaseException) -> bool:
+    """
+    If exc is an auth failure, forget the stored credentials (headers file plus
+    the is_connected / YTMusic client caches) and return True.
+    """
+    if not is_auth_error(exc):
+        return False
+    from .ytmusic import invalidate_ytmusic_cache
+    Path(HEADERS_FILE).unlink(missing_ok=True)
+    _invalidate_conn_cache()
+    invalidate_ytmusic_cache()
+    return True
 
 
 async def validate_auth(yt) -> bool:
@@ -49,9 +111,7 @@ async def validate_auth(yt) -> bool:
         )
         return True
     except Exception as e:
-        msg = str(e)
-        if any(code in msg for code in ("401", "403", "UNAUTHENTICATED")):
-            Path(HEADERS_FILE).unlink(missing_ok=True)
+        if invalidate_on_auth_error(e):
             return False
         raise
 
@@ -62,7 +122,7 @@ async def capture_headers_via_browser() -> None:
     Tries cookie extraction first; falls back to Playwright sign-in.
     """
     # ── Path 1: read cookies directly (instant) ────────────────────────────
-    cookie_str = _extract_cookies_from_browser()
+    cookie_str = await _extract_cookies_from_browser()
     if cookie_str:
         _write_headers_json(cookie_str)
         return
@@ -75,10 +135,27 @@ async def capture_headers_via_browser() -> None:
 # Path 1 — browser_cookie3
 # ──────────────────────────────────────────────────────────────────────────────
 
-def _extract_cookies_from_browser() -> str | None:
+def _load_cookie_str(load) -> str | None:
+    """Run one browser_cookie3 loader; return a cookie string if it has auth cookies."""
+    try:
+        jar = load(domain_name=".youtube.com")
+        cookies = {c.name: c.value for c in jar}
+        if any(name in cookies for name in _AUTH_COOKIES):
+            return "; ".join(f"{k}={v}" for k, v in cookies.items())
+    except Exception as e:
+        print(f"[auth] browser_cookie3 ({load.__name__}): {e}")
+    return None
+
+
+async def _extract_cookies_from_browser() -> str | None:
     """
     Use browser_cookie3 to read & decrypt YouTube cookies from the local
     Brave or Chrome profile. Returns a cookie string or None.
+
+    Loaders run off the event loop and are checked in priority order (Edge,
+    Brave, Chrome); the first hit wins. They normally all start at once, but
+    on macOS each can raise its own Keychain prompt, so there the next browser
+    is only read once the previous one came up empty.
     """
     try:
         import browser_cookie3
@@ -100,14 +177,20 @@ def _extract_cookies_from_browser() -> str | None:
     except AttributeError:
         pass
 
-    for load in loaders:
-        try:
-            jar = load(domain_name=".youtube.com")
-            cookies = {c.name: c.value for c in jar}
-            if any(name in cookies for name in _AUTH_COOKIES):
-                return "; ".join(f"{k}={v}" for k, v in cookies.items())
-        except Exception as e:
-            print(f"[auth] browser_cookie3 ({load.__name__}): {e}")
+    loop = asyncio.get_running_loop()
+
+    def start(load):
+        return loop.run_in_executor(None, _load_cookie_str, load)
+
+    if sys.platform == "darwin":
+        futures = (start(load) for load in loaders)  # lazy: one at a time
+    else:
+        futures = [start(load) for load in loaders]
+    # Awaited in loader order so priority doesn't depend on thread timing
+    for fut in futures:
+        cookie_str = await fut
+        if cookie_str:
+            return cookie_str
 
     return None
 
@@ -120,18 +203,18 @@ def _sapisid_hash(sapisid: str, origin: str = "https://music.youtube.com") -> st
     return f"SAPISIDHASH {ts}_{digest}"
 
 
+def _extract_sapisid(cookie_str: str) -> str:
+    """Return __Secure-3PAPISID (preferred) or SAPISID from a cookie string, or ""."""
+    m = _3PAPISID_RE.search(cookie_str) or _SAPISID_RE.search(cookie_str)
+    return m.group(1) if m else ""
+
+
 def _write_headers_json(cookie_str: str) -> None:
     """Write a minimal headers_auth.json that ytmusicapi will accept."""
     # Extract SAPISID (or __Secure-3PAPISID) from the cookie string so we can
     # generate the Authorization header that ytmusicapi v1.9+ requires to
     # identify this as browser-type auth (AuthType.BROWSER).
-    sapisid = ""
-    for part in cookie_str.split(";"):
-        name, _, value = part.strip().partition("=")
-        if name in ("__Secure-3PAPISID", "SAPISID"):
-            sapisid = value
-            if name == "__Secure-3PAPISID":
-                break  # prefer this one
+    sapisid = _extract_sapisid(cookie_str)
 
     headers = {
         "User-Agent": (
@@ -151,6 +234,7 @@ def _write_headers_json(cookie_str: str) -> None:
 
     with open(HEADERS_FILE, "w") as f:
         json.dump(headers, f, indent=2)
+    _invalidate_conn_cache()
 
 
 # ──────────────────────────────────────────────────────────────────────────────
@@ -2,19 +2,23 @@
 Conversion orchestrator.
 
 Streams Server-Sent Events for real-time progress.
-Supports checkpoint resume: saves progress to checkpoint_{playlist_id}.json
+Supports checkpoint resume: appends progress to checkpoint_{playlist_id}.jsonl
 so that if the same URL is converted again, already-found tracks are skipped.
 """
 from __future__ import annotations
 
 import asyncio
-import json
 import os
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import AsyncIterator
 
-from .spotify import Track, fetch_playlist
+from .auth import invalidate_on_auth_error
+from .fastjson import dumps, loads
+from .spotify import Track, fetch_playlist_pages
 from .ytmusic import (
+    ADD_CHUNK,
     YTMusic,
     add_tracks_to_playlist,
     create_playlist,
@@ -24,36 +28,96 @@ from .ytmusic import (
 CHECKPOINT_DIR = "checkpoints"
 CONCURRENCY = 5
 CHECKPOINT_INTERVAL = 10
+FRAME_BATCH_MAX = 8        # track frames joined into one SSE write at most
+FRAME_BATCH_WINDOW = 0.02  # seconds a burst may accumulate before flushing
 
-_sse = lambda d: f"data: {json.dumps(d)}\n\n"
+_PLAYLIST_RE = re.compile(r"playlist/([A-Za-z0-9]+)")
+
+# Checkpoint file I/O runs here rather than on the event loop. A single thread
+# keeps writes in submission order, even when a cancelled await leaves an
+# earlier write still running.
+_checkpoint_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="checkpoint")
+
+_sse = lambda d: b"data: " + dumps(d) + b"\n\n"
 _log = lambda msg: _sse({"type": "log", "message": msg})
 
 
-def _checkpoint_path(spotify_id: str) -> str:
+def _checkpoint_path(spotify_id: str, ext: str = "jsonl") -> str:
     os.makedirs(CHECKPOINT_DIR, exist_ok=True)
-    return os.path.join(CHECKPOINT_DIR, f"checkpoint_{spotify_id}.json")
+    return os.path.join(CHECKPOINT_DIR, f"checkpoint_{spotify_id}.{ext}")
 
 
 def _load_checkpoint(spotify_id: str) -> dict:
-    path = _checkpoint_path(spotify_id)
-    if os.path.exists(path):
+    """
+    Replay the checkpoint log. Each line is a partial checkpoint — a snapshot,
+    one {"k", "v"} search result, or a batch of "addedVideoIds" — applied in
+    order. A torn last line from a crash is skipped. A pre-log
+    checkpoint_{id}.json is read as a leading snapshot.
+    """
+    checkpoint: dict = {"results": {}}
+    for path in (_checkpoint_path(spotify_id, "json"), _checkpoint_path(spotify_id)):
         try:
-            with open(path) as f:
-                return json.load(f)
-        except Exception:
-            pass
-    return {}
+            with open(path, "rb") as f:
+                lines = f.readlines()
+        except OSError:
+            continue
+        for line in lines:
+            try:
+                rec = loads(line)
+            except ValueError:
+                continue
+            if not isinstance(rec, dict):
+                continue
+            if "k" in rec:
+                checkpoint["results"][rec["k"]] = rec["v"]
+                continue
+            if "playlistId" in rec:
+                checkpoint["playlistId"] = rec["playlistId"]
+            checkpoint["results"].update(rec.get("results") or {})
+            if "addedVideoIds" in rec:
+                checkpoint.setdefault("addedVideoIds", []).extend(rec["addedVideoIds"])
+    return checkpoint
+
+
+def _atomic_write(path: str, blob: bytes) -> None:
+    """Write blob to path via temp file + rename, so readers never see half a file."""
+    tmp = path + ".tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(blob)
+        while view:
+            view = view[os.write(fd, view):]
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(tmp, path)
 
 
 def _save_checkpoint(spotify_id: str, data: dict) -> None:
-    path = _checkpoint_path(spotify_id)
-    with open(path, "w") as f:
-        json.dump(data, f)
+    """Replace the checkpoint log with a single snapshot line."""
+    _atomic_write(_checkpoint_path(spotify_id), dumps(data) + b"\n")
+    try:
+        os.remove(_checkpoint_path(spotify_id, "json"))
+    except FileNotFoundError:
+        pass
+
+
+def _append_checkpoint(spotify_id: str, records: list[bytes]) -> None:
+    with open(_checkpoint_path(spotify_id), "ab") as f:
+        f.write(b"".join(records))
 
 
-async def convert_stream(spotify_url: str, yt: YTMusic) -> AsyncIterator[str]:
+def _clear_checkpoint(spotify_id: str) -> None:
+    for ext in ("jsonl", "json"):
+        try:
+            os.remove(_checkpoint_path(spotify_id, ext))
+        except FileNotFoundError:
+            pass
+
+
+async def convert_stream(spotify_url: str, yt: YTMusic) -> AsyncIterator[bytes]:
     """
-    Async generator that yields SSE-formatted strings.
+    Async generator that yields SSE-formatted byte frames.
 
     Event types:
       fetching  — started fetching Spotify data
@@ -63,34 +127,38 @@ async def convert_stream(spotify_url: str, yt: YTMusic) -> AsyncIterator[str]:
       done      — conversion complete
       error     — something went wrong
     """
-    m = re.search(r"playlist/([A-Za-z0-9]+)", spotify_url)
+    m = _PLAYLIST_RE.search(spotify_url)
     spotify_id = m.group(1) if m else "unknown"
 
     yield _sse({"type": "fetching"})
 
-    # --- Fetch Spotify tracks ---
+    # --- Fetch the first page of Spotify tracks; the rest stream in while searching ---
+    pages = fetch_playlist_pages(spotify_url)
     try:
-        playlist_name, tracks = await fetch_playlist(spotify_url)
+        playlist_name, total, first_page = await pages.__anext__()
     except Exception as exc:
         yield _sse({"type": "error", "message": f"Spotify fetch failed: {exc}"})
         return
 
-    total = len(tracks)
     yield _sse({"type": "fetched", "name": playlist_name, "total": total})
-    yield _log(f'Fetched "{playlist_name}" — {total} tracks from Spotify')
+    yield _log(f'Found "{playlist_name}" on Spotify — {total} tracks')
 
     # --- Load checkpoint ---
     checkpoint = _load_checkpoint(spotify_id)
     yt_playlist_id: str | None = checkpoint.get("playlistId")
     cached: dict[str, str | None] = checkpoint.get("results", {})  # track_key -> videoId | None
 
-    # Track which videoIds were already added in a previous session
-    cached_video_ids: set[str] = {v for v in cached.values() if v}
+    # Track which videoIds were already added in a previous session.
+    # Older checkpoints predate "addedVideoIds", so fall back to every cached hit.
+    if "addedVideoIds" in checkpoint:
+        cached_video_ids: set[str] = set(checkpoint["addedVideoIds"])
+    else:
+        cached_video_ids = set(filter(None, cached.values()))
 
     if yt_playlist_id:
         yield _log(
             f"Resuming from checkpoint: {len(cached_video_ids)} tracks already added, "
-            f"playlist {yt_playlist_id}, {len(cached) - len(cached_video_ids)} previously missing"
+            f"playlist {yt_playlist_id}, {len(cached)} tracks previously searched"
         )
     else:
         yield _log("No checkpoint — starting fresh")
@@ -103,24 +171,35 @@ async def convert_stream(spotify_url: str, yt: YTMusic) -> AsyncIterator[str]:
                 name=f"{playlist_name} (from Spotify)",
                 description=f"Converted from Spotify: {spotify_url}",
             )
-            checkpoint = {"playlistId": yt_playlist_id, "results": cached}
-            _save_checkpoint(spotify_id, checkpoint)
             yield _log(f"Created YouTube Music playlist: {yt_playlist_id}")
         except Exception as exc:
-            msg = str(exc)
-            if any(code in msg for code in ("401", "403", "Unauthorized", "UNAUTHENTICATED")):
-                from pathlib import Path
-                Path("headers_auth.json").unlink(missing_ok=True)
+            if invalidate_on_auth_error(exc):
                 yield _sse({"type": "error", "message": "YouTube Music credentials expired. Please reconnect."})
             else:
                 yield _sse({"type": "error", "message": f"Could not create playlist: {exc}"})
+            await pages.aclose()
             return
     else:
         yield _log(f"Reusing existing YouTube Music playlist: {yt_playlist_id}")
 
-    # --- Parallel search with semaphore ---
-    sem = asyncio.Semaphore(CONCURRENCY)
-
+    # Compact whatever was replayed into one snapshot line; from here on only
+    # new search results and added batches are appended to the log
+    checkpoint = {
+        "playlistId": yt_playlist_id,
+        "results": cached,
+        "addedVideoIds": list(cached_video_ids),
+    }
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(_checkpoint_pool, _save_checkpoint, spotify_id, checkpoint)
+    log_records: list[bytes] = []
+
+    async def flush_checkpoint() -> None:
+        if log_records:
+            records = log_records[:]
+            log_records.clear()
+            await loop.run_in_executor(_checkpoint_pool, _append_checkpoint, spotify_id, records)
+
+    # --- Parallel search with a bounded worker pool ---
     cached_count = len(cached)
     new_to_search = total - cached_count
     if new_to_search > 0:
@@ -128,66 +207,138 @@ async def convert_stream(spotify_url: str, yt: YTMusic) -> AsyncIterator[str]:
     else:
         yield _log(f"All {total} tracks already searched (from checkpoint)")
 
-    async def bounded_search(i: int, t: Track) -> tuple[int, Track, str | None]:
+    # (index, track) in, (index, track, videoId) out; None on either queue
+    # means "no more tracks" / "a worker exited" respectively
+    in_q: asyncio.Queue[tuple[int, Track] | None] = asyncio.Queue()
+    out_q: asyncio.Queue[tuple[int, Track, str | None] | None] = asyncio.Queue()
+
+    async def produce() -> None:
+        """Feed tracks to the workers as Spotify pages arrive."""
+        i = 0
+        try:
+            for t in first_page:
+                in_q.put_nowait((i, t))
+                i += 1
+            async for _, _, page in pages:
+                for t in page:
+                    in_q.put_nowait((i, t))
+                    i += 1
+        finally:
+            for _ in range(CONCURRENCY):
+                in_q.put_nowait(None)
+
+    # One thread per worker, so searches never queue behind other users of
+    # the loop's default executor (cookie loading, checkpoint compaction…)
+    search_pool = ThreadPoolExecutor(max_workers=CONCURRENCY, thread_name_prefix="yt-search")
+
+    # Duplicate tracks searched concurrently share one YT Music request
+    inflight: dict[str, asyncio.Future[str | None]] = {}
+
+    async def lookup(t: Track) -> str | None:
         key = f"{t.artists}||{t.name}"
         if key in cached:
-            return i, t, cached[key]  # resume: already searched
-        async with sem:
-            vid = await search_track(yt, t.name, t.artists)
-        cached[key] = vid
-        return i, t, vid
-
-    tasks = [asyncio.ensure_future(bounded_search(i, t)) for i, t in enumerate(tracks)]
+            return cached[key]  # resume: already searched
+        if key in inflight:
+            return await inflight[key]
+        fut = inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            vid = await search_track(yt, t.name, t.artists, search_pool)
+            cached[key] = vid
+            log_records.append(dumps({"k": key, "v": vid}) + b"\n")
+            fut.set_result(vid)
+            return vid
+        except Exception as exc:
+            fut.set_exception(exc)
+            fut.exception()  # mark retrieved — there may be no other waiters
+            raise
+        finally:
+            del inflight[key]
+            if not fut.done():
+                fut.cancel()  # worker cancelled mid-search
+
+    async def worker() -> None:
+        while True:
+            item = await in_q.get()
+            if item is None:
+                out_q.put_nowait(None)
+                return
+            i, t = item
+            try:
+                vid = await lookup(t)
+            except Exception:
+                vid = None  # not cached, so it is retried on resume
+            out_q.put_nowait((i, t, vid))
+
+    workers = [asyncio.create_task(worker()) for _ in range(CONCURRENCY)]
+    producer = asyncio.create_task(produce())
 
     # (original_index, video_id) — collected to preserve Spotify track order
     ordered_new: list[tuple[int, str]] = []
     missing_tracks: list[dict] = []
     completed = 0
 
-    # Stream results as they complete (UI order = search completion order)
-    for coro in asyncio.as_completed(tasks):
-        try:
-            idx, track, video_id = await coro
-        except Exception:
-            completed += 1
-            yield _sse({
-                "type": "track",
-                "i": completed,
-                "total": total,
-                "name": "Unknown",
-                "artists": "",
-                "status": "missing",
-            })
-            continue
-
-        completed += 1
-        status = "found" if video_id else "missing"
-
-        event: dict = {
-            "type": "track",
-            "i": completed,
-            "total": total,
-            "name": track.name,
-            "artists": track.artists,
-            "status": status,
-        }
-        if video_id:
-            event["videoId"] = video_id
-            if video_id not in cached_video_ids:
-                ordered_new.append((idx, video_id))
-        else:
-            missing_tracks.append({"name": track.name, "artists": track.artists})
-
-        yield _sse(event)
-
-        # Persist checkpoint every CHECKPOINT_INTERVAL tracks
-        if completed % CHECKPOINT_INTERVAL == 0:
-            checkpoint["results"] = cached
-            _save_checkpoint(spotify_id, checkpoint)
-
-    # Final checkpoint write
-    checkpoint["results"] = cached
-    _save_checkpoint(spotify_id, checkpoint)
+    # Stream results as they complete (UI order = search completion order).
+    # Frames from a burst of completions are joined into one write; a frame
+    # is flushed immediately once no further results are queued.
+    pending_frames: list[bytes] = []
+    last_flush = time.monotonic()
+    finished_workers = 0
+    try:
+        while finished_workers < CONCURRENCY:
+            result = await out_q.get()
+            if result is None:
+                finished_workers += 1
+            else:
+                completed += 1
+                idx, track, video_id = result
+                status = "found" if video_id else "missing"
+
+                event: dict = {
+                    "type": "track",
+                    "i": completed,
+                    "total": total,
+                    "name": track.name,
+                    "artists": track.artists,
+                    "status": status,
+                }
+                if video_id:
+                    event["videoId"] = video_id
+                    if video_id not in cached_video_ids:
+                        ordered_new.append((idx, video_id))
+                else:
+                    missing_tracks.append({"name": track.name, "artists": track.artists})
+                pending_frames.append(_sse(event))
+
+                # Persist checkpoint every CHECKPOINT_INTERVAL tracks
+                if completed % CHECKPOINT_INTERVAL == 0:
+                    await flush_checkpoint()
+
+            now = time.monotonic()
+            if pending_frames and (
+                out_q.empty()
+                or len(pending_frames) >= FRAME_BATCH_MAX
+                or now - last_flush > FRAME_BATCH_WINDOW
+            ):
+                yield b"".join(pending_frames)
+                pending_frames.clear()
+                last_flush = now
+    finally:
+        # Client disconnects close the generator mid-loop — don't leak tasks
+        producer.cancel()
+        for w in workers:
+            w.cancel()
+        search_pool.shutdown(wait=False)
+        # Let the producer unwind before closing the page generator it iterates
+        await asyncio.gather(producer, return_exceptions=True)
+        await pages.aclose()
+        await flush_checkpoint()
+
+    # A later Spotify page failed: keep what was searched for the next resume
+    try:
+        await producer
+    except Exception as exc:
+        yield _sse({"type": "error", "message": f"Spotify fetch failed: {exc}"})
+        return
 
     total_found = len(ordered_new) + len(cached_video_ids)
     yield _log(
@@ -208,15 +359,20 @@ async def convert_stream(spotify_url: str, yt: YTMusic) -> AsyncIterator[str]:
 
     # --- Add only newly-found tracks to the playlist ---
     if new_video_ids:
-        batch_size = 50
-        n_batches = (len(new_video_ids) + batch_size - 1) // batch_size
+        n_batches = (len(new_video_ids) + ADD_CHUNK - 1) // ADD_CHUNK
         yield _log(f"Adding {len(new_video_ids)} new tracks in {n_batches} batch(es)…")
+        # One batch at a time: YT Music appends in arrival order, so this keeps
+        # the Spotify track order
         try:
-            for i in range(0, len(new_video_ids), batch_size):
-                batch_num = i // batch_size + 1
-                batch = new_video_ids[i : i + batch_size]
+            for i in range(0, len(new_video_ids), ADD_CHUNK):
+                batch_num = i // ADD_CHUNK + 1
+                batch = new_video_ids[i : i + ADD_CHUNK]
                 yield _log(f"  Batch {batch_num}/{n_batches}: {len(batch)} tracks")
                 await add_tracks_to_playlist(yt, yt_playlist_id, batch)
+                # Record what actually made it into the playlist so a crash
+                # mid-add doesn't skip (or re-add) tracks on resume
+                log_records.append(dumps({"addedVideoIds": batch}) + b"\n")
+                await flush_checkpoint()
         except Exception as exc:
             yield _sse({"type": "error", "message": f"Error adding tracks to playlist: {exc}"})
             return
@@ -233,7 +389,4 @@ async def convert_stream(spotify_url: str, yt: YTMusic) -> AsyncIterator[str]:
     })
 
     # Clear checkpoint on successful completion so next run starts fresh
-    try:
-        os.remove(_checkpoint_path(spotify_id))
-    except FileNotFoundError:
-        pass
+    _clear_checkpoint(spotify_id)
@@ -0,0 +1,19 @@
+"""
+JSON encode/decode shared by the backend: orjson when installed, else stdlib.
+
+dumps() returns compact UTF-8 bytes either way; loads() accepts str or bytes.
+"""
+from __future__ import annotations
+
+import json
+
+try:
+    import orjson
+except ImportError:  # optional speedup — fall back to the stdlib codec
+    orjson = None
+
+if orjson is not None:
+    dumps, loads = orjson.dumps, orjson.loads
+else:
+    dumps = lambda d: json.dumps(d, separators=(",", ":")).encode()
+    loads = json.loads
@@ -11,14 +11,20 @@ The embed scraper is the only credential-free path.
 """
 from __future__ import annotations
 
-import json
+import asyncio
 import os
 import re
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from dataclasses import dataclass
+from typing import AsyncIterator
 
 import httpx
 from dotenv import load_dotenv
 
+from .fastjson import loads
+
 load_dotenv()
 
 SPOTIFY_CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID")
@@ -33,15 +39,71 @@ EMBED_HEADERS = {
     "Accept-Language": "en-US,en;q=0.9",
 }
 
+_PLAYLIST_ID_RE = re.compile(r"playlist/([A-Za-z0-9]+)")
+
+# One keep-alive HTTP/2 client shared by every request, so the token call,
+# metadata and pagination reuse warm TLS connections. Created on first use.
+_client: httpx.AsyncClient | None = None
+
+
+async def _client_for() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=True,
+            follow_redirects=True,
+            timeout=30,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+            headers=EMBED_HEADERS,
+        )
+    return _client
+
+
+# Headless Chromium for the web-player scraper, launched on first use and
+# kept alive; each scrape gets its own short-lived browser context
+_pw = None
+_browser = None
+_browser_lock: asyncio.Lock | None = None
+
+
+async def _browser_for():
+    global _pw, _browser, _browser_lock
+    if _browser_lock is None:
+        _browser_lock = asyncio.Lock()  # created lazily so it binds to the running loop
+    async with _browser_lock:
+        if _browser is None or not _browser.is_connected():
+            from playwright.async_api import async_playwright
+            if _pw is None:
+                _pw = await async_playwright().start()
+            _browser = await _pw.chromium.launch(headless=True)
+    return _browser
+
+
+async def shutdown() -> None:
+    """Close the shared HTTP client and browser (called on app shutdown)."""
+    global _client, _browser, _pw
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+    if _browser is not None:
+        await _browser.close()
+        _browser = None
+    if _pw is not None:
+        await _pw.stop()
+        _pw = None
+
 
 @dataclass
 class Track:
+    # Explicit __slots__ rather than dataclass(slots=True), which needs 3.10
+    __slots__ = ("name", "artists")
+
     name: str
     artists: str
 
 
 def _extract_playlist_id(url: str) -> str:
-    m = re.search(r"playlist/([A-Za-z0-9]+)", url)
+    m = _PLAYLIST_ID_RE.search(url)
     if not m:
         raise ValueError(f"Could not find playlist ID in URL: {url}")
     return m.group(1)
@@ -51,13 +113,19 @@ def _extract_playlist_id(url: str) -> str:
 # Shared HTML parser
 # ---------------------------------------------------------------------------
 
-def _parse_next_data(html: str, playlist_id: str) -> tuple[str, list[Track]]:
-    """Extract playlist name and tracks from a Spotify embed page HTML string."""
-    m = re.search(r'<script id="__NEXT_DATA__"[^>]*>(.*?)</script>', html, re.DOTALL)
-    if not m:
+def _parse_next_data(html: str, playlist_id: str) -> tuple[str, list[Track], int | None]:
+    """
+    Extract playlist name, tracks and the reported track count from a Spotify
+    embed page HTML string. The count is None when the payload doesn't carry one.
+    """
+    # Plain str.find scans — the page is hundreds of KB and we need one tag
+    start = html.find('<script id="__NEXT_DATA__"')
+    body_start = html.find(">", start) + 1
+    end = html.find("</script>", body_start)
+    if start == -1 or body_start == 0 or end == -1:
         raise RuntimeError("Could not find __NEXT_DATA__ in Spotify embed page")
 
-    data = json.loads(m.group(1))
+    data = loads(html[body_start:end])
 
     # Navigate to the entity data — structure may vary slightly, try both paths
     try:
@@ -88,20 +156,38 @@ def _parse_next_data(html: str, playlist_id: str) -> tuple[str, list[Track]]:
             "The playlist may be empty or the page structure changed."
         )
 
-    return playlist_name, tracks
+    # trackList is capped, but the entity still reports the real size
+    total = entity.get("trackCount") or entity.get("totalCount") or None
+
+    return playlist_name, tracks, total
 
 
 # ---------------------------------------------------------------------------
 # Primary: embed scrape — fast HTTP path (works for playlists ≤ ~100 tracks)
 # ---------------------------------------------------------------------------
 
-async def _fetch_via_embed_http(playlist_id: str) -> tuple[str, list[Track]]:
+_EMBED_TRACK_CAP = 100  # trackList length limit in the embed's __NEXT_DATA__
+
+
+async def _fetch_via_embed_http(playlist_id: str) -> tuple[str, list[Track], int | None]:
     """Single HTTP GET of the embed page; only returns the initial ~100 tracks."""
     embed_url = f"https://open.spotify.com/embed/playlist/{playlist_id}"
-    async with httpx.AsyncClient(follow_redirects=True, timeout=30) as client:
-        resp = await client.get(embed_url, headers=EMBED_HEADERS)
+    client = await _client_for()
+    # Stream the page and stop once the __NEXT_DATA__ script has closed; the
+    # rest of the HTML (trackers, footer) is never needed
+    marker = b'<script id="__NEXT_DATA__"'
+    buf = bytearray()
+    start = -1
+    async with client.stream("GET", embed_url) as resp:
         resp.raise_for_status()
-    return _parse_next_data(resp.text, playlist_id)
+        async for chunk in resp.aiter_bytes():
+            prev_len = len(buf)
+            buf += chunk
+            if start == -1:
+                start = buf.find(marker, max(0, prev_len - len(marker)))
+            if start != -1 and buf.find(b"</script>", max(start, prev_len - 8)) != -1:
+                break
+    return _parse_next_data(buf.decode("utf-8", "replace"), playlist_id)
 
 
 async def _fetch_via_webplayer(playlist_id: str) -> tuple[str, list[Track]]:
@@ -113,51 +199,84 @@ async def _fetch_via_webplayer(playlist_id: str) -> tuple[str, list[Track]]:
     paginates through every track via its partner API and reports totalCount,
     so this path works for playlists of any length.
     """
-    from playwright.async_api import async_playwright
-
     playlist_url = f"https://open.spotify.com/playlist/{playlist_id}"
 
-    collected: dict[int, Track] = {}   # absolute_position -> Track
+    # absolute_position -> Track until totalCount is known; after that tracks
+    # go straight into a preallocated list indexed by position
+    collected: dict[int, Track] = {}
+    slots: list[Track | None] | None = None
+    filled = 0  # non-empty entries in `slots`
     playlist_name = ""
     total_count = 0
     seen: set[tuple] = set()  # (operationName, offset) — avoids cross-op collisions
+    progress = asyncio.Event()  # set whenever a response adds tracks
+    first_items = asyncio.Event()  # set once, when the first tracks arrive
+
+    def _count() -> int:
+        return filled + len(collected)
 
     def _ingest(content: dict, base_offset: int) -> None:
-        nonlocal total_count
+        nonlocal total_count, slots, filled
         if not content:
             return
+        before = _count()
         if content.get("totalCount") and not total_count:
             total_count = content["totalCount"]
-        for i, item in enumerate(content.get("items") or []):
-            td = ((item.get("itemV2") or {}).get("data")) or {}
-            name = td.get("name", "")
+            slots = [None] * total_count
+            for pos, t in collected.items():
+                if pos < total_count:
+                    slots[pos] = t
+                    filled += 1
+            collected.clear()
+        for i, item in enumerate(content.get("items") or ()):
+            iv2 = item.get("itemV2")
+            td = iv2.get("data") if iv2 else None
+            if not td:
+                continue
+            name = td.get("name")
             if not name:
                 continue
-            artists = ", ".join(
-                (a.get("profile") or {}).get("name", "")
-                for a in (td.get("artists") or {}).get("items", [])
-                if (a.get("profile") or {}).get("name")
-            )
-            collected[base_offset + i] = Track(name=name, artists=artists)
-
-    async with async_playwright() as pw:
-        browser = await pw.chromium.launch(headless=True)
-        context = await browser.new_context(viewport={"width": 1280, "height": 800})
+            arts = td.get("artists")
+            names = [
+                n
+                for a in (arts.get("items") or () if arts else ())
+                if (p := a.get("profile")) and (n := p.get("name"))
+            ]
+            track = Track(name=name, artists=", ".join(names))
+            pos = base_offset + i
+            if slots is None:
+                collected[pos] = track
+            elif pos < total_count:
+                if slots[pos] is None:
+                    filled += 1
+                slots[pos] = track
+        if _count() > before:
+            progress.set()
+            first_items.set()
+
+    browser = await _browser_for()
+    context = await browser.new_context(viewport={"width": 1280, "height": 800})
+    try:
         page = await context.new_page()
 
         async def on_response(response):
             nonlocal playlist_name
-            if "api-partner.spotify.com" not in response.url:
+            # Cheap filters first: the page emits hundreds of script/image/font
+            # responses, and only fetch/XHR calls to the partner API matter
+            if (
+                response.request.resource_type not in ("fetch", "xhr")
+                or "api-partner.spotify.com" not in response.url
+            ):
                 return
             try:
-                req_body = json.loads(response.request.post_data or "{}")
+                req_body = loads(response.request.post_data_buffer or b"{}")
                 op = req_body.get("operationName", "")
                 offset = req_body.get("variables", {}).get("offset", 0)
                 key = (op, offset)
                 if key in seen:
                     return
                 seen.add(key)
-                body = await response.json()
+                body = loads(await response.body())
                 pl = (body.get("data") or {}).get("playlistV2") or {}
                 if pl.get("name") and not playlist_name:
                     playlist_name = pl["name"]
@@ -166,18 +285,29 @@ async def _fetch_via_webplayer(playlist_id: str) -> tuple[str, list[Track]]:
                 pass
 
         page.on("response", on_response)
-        await page.goto(playlist_url, wait_until="networkidle")
+        # The player never goes network-idle (telemetry, audio preflight), so
+        # start scrolling once the first playlist page has been intercepted
+        await page.goto(playlist_url, wait_until="domcontentloaded")
+        try:
+            await asyncio.wait_for(first_items.wait(), timeout=15)
+        except asyncio.TimeoutError:
+            pass  # let the scroll loop nudge it; embed fallback if still empty
 
-        # Scroll with mouse wheel (triggers Spotify's lazy-loading)
+        # Scroll with mouse wheel (triggers Spotify's lazy-loading), then move
+        # on as soon as new tracks arrive rather than after a fixed delay
         await page.mouse.move(640, 400)
         stale = 0
         prev = 0
         for _ in range(200):
-            if total_count and len(collected) >= total_count:
+            if total_count and _count() >= total_count:
                 break
+            progress.clear()
             await page.mouse.wheel(0, 3000)
-            await page.wait_for_timeout(500)
-            cur = len(collected)
+            try:
+                await asyncio.wait_for(progress.wait(), timeout=0.5)
+            except asyncio.TimeoutError:
+                pass
+            cur = _count()
             if cur == prev:
                 stale += 1
                 if stale >= 8:
@@ -185,26 +315,34 @@ async def _fetch_via_webplayer(playlist_id: str) -> tuple[str, list[Track]]:
             else:
                 stale = 0
             prev = cur
+    finally:
+        await context.close()
 
-        await browser.close()
-
-    if not collected:
-        return await _fetch_via_embed_http(playlist_id)
+    if not _count():
+        name, tracks, _ = await _fetch_via_embed_http(playlist_id)
+        return name, tracks
 
-    return playlist_name or "Spotify Playlist", [collected[k] for k in sorted(collected)]
+    if slots is not None:
+        tracks = [t for t in slots if t is not None]
+    else:
+        tracks = [collected[k] for k in sorted(collected)]
+    return playlist_name or "Spotify Playlist", tracks
 
 
 async def _fetch_via_embed(playlist_id: str) -> tuple[str, list[Track]]:
     """
     Scrape the Spotify embed page for track data (no credentials required).
 
-    Uses a fast HTTP GET first. If the result contains ≥100 tracks (the embed
-    hard-cap), falls back to the full web player which paginates via the
+    Uses a fast HTTP GET first. If the playlist is larger than the embed's
+    100-track cap, falls back to the full web player which paginates via the
     partner API and works for playlists of any length.
     """
-    name, tracks = await _fetch_via_embed_http(playlist_id)
+    name, tracks, total = await _fetch_via_embed_http(playlist_id)
 
-    if len(tracks) >= 100:
+    # Trust the reported count when present, so a playlist of exactly 100
+    # doesn't launch a browser; otherwise a full trackList means truncation
+    truncated = total > _EMBED_TRACK_CAP if total else len(tracks) >= _EMBED_TRACK_CAP
+    if truncated:
         return await _fetch_via_webplayer(playlist_id)
 
     return name, tracks
@@ -218,52 +356,119 @@ async def _fetch_via_embed(playlist_id: str) -> tuple[str, list[Track]]:
 # Only use this if you own/collaborate on the target playlist.
 # ---------------------------------------------------------------------------
 
+# Client-credentials tokens last an hour; reuse one until shortly before expiry
+_token_cache: tuple[str, float] | None = None  # (access_token, expires_at monotonic)
+_token_lock: asyncio.Lock | None = None
+
+
 async def _get_spotify_token() -> str:
-    import base64
-    creds = base64.b64encode(f"{SPOTIFY_CLIENT_ID}:{SPOTIFY_CLIENT_SECRET}".encode()).decode()
-    async with httpx.AsyncClient() as client:
+    global _token_cache, _token_lock
+    if _token_lock is None:
+        _token_lock = asyncio.Lock()  # created lazily so it binds to the running loop
+    async with _token_lock:
+        if _token_cache and _token_cache[1] - time.monotonic() > 60:
+            return _token_cache[0]
+        import base64
+        creds = base64.b64encode(f"{SPOTIFY_CLIENT_ID}:{SPOTIFY_CLIENT_SECRET}".encode()).decode()
+        client = await _client_for()
         resp = await client.post(
             "https://accounts.spotify.com/api/token",
             data={"grant_type": "client_credentials"},
             headers={"Authorization": f"Basic {creds}"},
         )
         resp.raise_for_status()
-        return resp.json()["access_token"]
+        body = resp.json()
+        _token_cache = (body["access_token"], time.monotonic() + body.get("expires_in", 3600))
+        return body["access_token"]
+
+
+_API_PAGE_SIZE = 100
+_API_CONCURRENCY = 8  # parallel page requests; more tends to trigger 429s
+_API_TRACK_FIELDS = "items(track(name,artists(name)))"
+
+
+async def _api_get(
+    client: httpx.AsyncClient,
+    sem: asyncio.Semaphore,
+    url: str,
+    headers: dict,
+    params: dict,
+    retries: int = 4,
+) -> dict:
+    """GET a Spotify API URL under `sem`, waiting out 429s per Retry-After."""
+    async with sem:
+        for attempt in range(retries + 1):
+            resp = await client.get(url, headers=headers, params=params)
+            if resp.status_code == 429 and attempt < retries:
+                await asyncio.sleep(float(resp.headers.get("Retry-After", 1)))
+                continue
+            resp.raise_for_status()
+            return loads(resp.content)
 
 
-async def _fetch_via_api(playlist_id: str) -> tuple[str, list[Track]]:
+def _parse_api_items(body: dict) -> list[Track]:
+    tracks: list[Track] = []
+    for item in body.get("items", []):
+        track = item.get("track")
+        if track:
+            name = track.get("name", "")
+            artists = ", ".join([a["name"] for a in track.get("artists", ())])
+            if name:
+                tracks.append(Track(name=name, artists=artists))
+    return tracks
+
+
+async def _iter_api_pages(playlist_id: str) -> AsyncIterator[tuple[str, int, list[Track]]]:
+    """
+    Yield (playlist_name, total, tracks) for each page of the playlist.
+
+    The first page reports `total`; every later page is then requested at
+    once by offset (bounded by _API_CONCURRENCY) and yielded in order.
+    """
     token = await _get_spotify_token()
     headers = {"Authorization": f"Bearer {token}"}
-    tracks: list[Track] = []
     playlist_name = "Spotify Playlist"
+    sem = asyncio.Semaphore(_API_CONCURRENCY)
+
+    client = await _client_for()
+    # Playlist metadata and the first tracks page go out together
+    url = f"https://api.spotify.com/v1/playlists/{playlist_id}/tracks"
+    meta, first = await asyncio.gather(
+        _api_get(
+            client, sem, f"https://api.spotify.com/v1/playlists/{playlist_id}",
+            headers, {"fields": "name"},
+        ),
+        _api_get(
+            client, sem, url, headers,
+            {"limit": _API_PAGE_SIZE, "fields": f"total,{_API_TRACK_FIELDS}"},
+        ),
+    )
+    playlist_name = meta.get("name", playlist_name)
+    total = first.get("total", 0)
+    yield playlist_name, total, _parse_api_items(first)
+
+    tasks = [
+        asyncio.create_task(_api_get(
+            client, sem, url, headers,
+            {"offset": offset, "limit": _API_PAGE_SIZE, "fields": _API_TRACK_FIELDS},
+        ))
+        for offset in range(_API_PAGE_SIZE, total, _API_PAGE_SIZE)
+    ]
+    try:
+        for task in tasks:
+            yield playlist_name, total, _parse_api_items(await task)
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Retrieve every outcome so failed pages don't log "never retrieved"
+        await asyncio.gather(*tasks, return_exceptions=True)
 
-    async with httpx.AsyncClient(timeout=30) as client:
-        # Fetch playlist metadata
-        meta = await client.get(
-            f"https://api.spotify.com/v1/playlists/{playlist_id}",
-            headers=headers,
-            params={"fields": "name"},
-        )
-        meta.raise_for_status()
-        playlist_name = meta.json().get("name", playlist_name)
-
-        # Paginate through all tracks
-        url = f"https://api.spotify.com/v1/playlists/{playlist_id}/tracks"
-        params: dict = {"limit": 100, "fields": "next,items(track(name,artists(name)))"}
-        while url:
-            resp = await client.get(url, headers=headers, params=params)
-            resp.raise_for_status()
-            body = resp.json()
-            for item in body.get("items", []):
-                track = item.get("track")
-                if track:
-                    name = track.get("name", "")
-                    artists = ", ".join(a["name"] for a in track.get("artists", []))
-                    if name:
-                        tracks.append(Track(name=name, artists=artists))
-            url = body.get("next")
-            params = {}  # next URL already has params encoded
 
+async def _fetch_via_api(playlist_id: str) -> tuple[str, list[Track]]:
+    tracks: list[Track] = []
+    playlist_name = "Spotify Playlist"
+    async for playlist_name, _, page in _iter_api_pages(playlist_id):
+        tracks.extend(page)
     return playlist_name, tracks
 
 
@@ -271,11 +476,97 @@ async def _fetch_via_api(playlist_id: str) -> tuple[str, list[Track]]:
 # Public API
 # ---------------------------------------------------------------------------
 
+# Recently fetched playlists, so a preview followed by a convert (or a retry)
+# doesn't scrape the same playlist twice. Oldest entries are evicted first.
+_PL_CACHE_TTL = 300  # seconds
+_PL_CACHE_SIZE = 64
+_pl_cache: OrderedDict[str, tuple[float, str, list[Track]]] = OrderedDict()
+_pl_locks: dict[str, asyncio.Lock] = {}
+_pl_lock_users: dict[str, int] = {}  # holders + waiters per playlist ID
+
+
+def _cache_get(playlist_id: str) -> tuple[str, list[Track]] | None:
+    entry = _pl_cache.get(playlist_id)
+    if entry is None:
+        return None
+    stored_at, name, tracks = entry
+    if time.monotonic() - stored_at > _PL_CACHE_TTL:
+        del _pl_cache[playlist_id]
+        return None
+    _pl_cache.move_to_end(playlist_id)
+    return name, list(tracks)  # copy so callers can't mutate the cached list
+
+
+def _cache_put(playlist_id: str, name: str, tracks: list[Track]) -> None:
+    _pl_cache[playlist_id] = (time.monotonic(), name, list(tracks))
+    _pl_cache.move_to_end(playlist_id)
+    while len(_pl_cache) > _PL_CACHE_SIZE:
+        _pl_cache.popitem(last=False)
+
+
+@asynccontextmanager
+async def _playlist_lock(playlist_id: str):
+    """Serialise fetches of one playlist so concurrent callers share a scrape."""
+    lock = _pl_locks.get(playlist_id)
+    if lock is None:
+        lock = _pl_locks[playlist_id] = asyncio.Lock()
+    # Counted rather than checked with lock.locked(): a released lock reads as
+    # unlocked before the woken waiter acquires it, so it could be dropped
+    # while still in use and a newcomer would scrape in parallel
+    _pl_lock_users[playlist_id] = _pl_lock_users.get(playlist_id, 0) + 1
+    try:
+        async with lock:
+            yield
+    finally:
+        _pl_lock_users[playlist_id] -= 1
+        if not _pl_lock_users[playlist_id]:
+            del _pl_lock_users[playlist_id]
+            del _pl_locks[playlist_id]
+
+
 async def fetch_playlist(url: str) -> tuple[str, list[Track]]:
     """Return (playlist_name, tracks) for a Spotify playlist URL."""
     playlist_id = _extract_playlist_id(url)
 
-    if SPOTIFY_CLIENT_ID and SPOTIFY_CLIENT_SECRET:
-        return await _fetch_via_api(playlist_id)
+    cached = _cache_get(playlist_id)
+    if cached:
+        return cached
+
+    async with _playlist_lock(playlist_id):
+        cached = _cache_get(playlist_id)
+        if cached:
+            return cached
+        if SPOTIFY_CLIENT_ID and SPOTIFY_CLIENT_SECRET:
+            name, tracks = await _fetch_via_api(playlist_id)
+        else:
+            name, tracks = await _fetch_via_embed(playlist_id)
+        _cache_put(playlist_id, name, tracks)
+        return name, list(tracks)
+
 
-    return await _fetch_via_embed(playlist_id)
+async def fetch_playlist_pages(url: str) -> AsyncIterator[tuple[str, int, list[Track]]]:
+    """
+    Yield (playlist_name, total, tracks) one page at a time, so callers can
+    start work on the first tracks while later pages are still loading.
+
+    `total` is Spotify's reported track count and may include unplayable items
+    that never show up in a page. Only the API path is paginated; the scrapers
+    build their list in one go and yield it as a single page.
+
+    Unlike fetch_playlist this never reads the cache: a conversion should see
+    edits made on Spotify a moment ago. The finished result still refreshes
+    the cache for later previews.
+    """
+    playlist_id = _extract_playlist_id(url)
+
+    if SPOTIFY_CLIENT_ID and SPOTIFY_CLIENT_SECRET:
+        name, tracks = "", []
+        async for name, total, page in _iter_api_pages(playlist_id):
+            tracks.extend(page)
+            yield name, total, page
+        _cache_put(playlist_id, name, tracks)
+        return
+
+    name, tracks = await _fetch_via_embed(playlist_id)
+    _cache_put(playlist_id, name, tracks)
+    yield name, len(tracks), list(tracks)
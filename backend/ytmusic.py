@@ -4,37 +4,66 @@ YouTube Music helpers: search and playlist management via ytmusicapi.
 from __future__ import annotations
 
 import asyncio
+import os
+import time
+from concurrent.futures import Executor
 from typing import Optional
 
 from ytmusicapi import YTMusic
 
+from .auth import HEADERS_FILE
 
-def get_ytmusic(auth_path: str = "headers_auth.json") -> YTMusic:
+
+# Client reused across conversions while headers_auth.json is unchanged
+_YT_TTL = 300  # seconds
+_yt_cache: tuple[str, float, float, YTMusic] | None = None  # (path, mtime, cached_at, yt)
+
+
+def get_ytmusic(auth_path: str = HEADERS_FILE) -> YTMusic:
     """Return an authenticated YTMusic instance."""
-    return YTMusic(auth_path)
+    global _yt_cache
+    try:
+        mtime = os.stat(auth_path).st_mtime
+    except OSError:
+        return YTMusic(auth_path)  # let ytmusicapi report the problem
+    now = time.monotonic()
+    if _yt_cache:
+        path, cached_mtime, cached_at, yt = _yt_cache
+        if path == auth_path and cached_mtime == mtime and now - cached_at < _YT_TTL:
+            return yt
+    yt = YTMusic(auth_path)
+    _yt_cache = (auth_path, mtime, now, yt)
+    return yt
 
 
-def _run(fn):
-    return asyncio.get_running_loop().run_in_executor(None, fn)
+def invalidate_ytmusic_cache() -> None:
+    global _yt_cache
+    _yt_cache = None
+
+
+def _run(fn, executor: Optional[Executor] = None):
+    return asyncio.get_running_loop().run_in_executor(executor, fn)
 
 
 async def search_track(
     yt: YTMusic,
     name: str,
     artists: str,
+    executor: Optional[Executor] = None,
 ) -> Optional[str]:
     """
     Two-stage search:
       1. Filter by 'songs' (most accurate).
-      2. Unfiltered fallback.
+      2. Unfiltered fallback, only sent if stage 1 found nothing.
 
-    Returns videoId or None.
+    Returns videoId or None. Pass `executor` to run the blocking ytmusicapi
+    calls on a dedicated pool instead of the loop's default one.
     """
     query = f"{artists} {name}".strip()
 
     # Stage 1: songs filter
     try:
-        results = await _run(lambda: yt.search(query, filter="songs", limit=3))
+        results = await _run(lambda: yt.search(query, filter="songs", limit=3), executor)
         if results:
             return results[0].get("videoId")
     except Exception:
@@ -42,7 +71,7 @@ async def search_track(
 
     # Stage 2: unfiltered fallback
     try:
-        results = await _run(lambda: yt.search(query, limit=5))
+        results = await _run(lambda: yt.search(query, limit=5), executor)
         for r in results:
             vid = r.get("videoId")
             if vid:
@@ -61,12 +90,16 @@ async def create_playlist(yt: YTMusic, name: str, description: str = "") -> str:
     return result.get("playlistId", result)
 
 
+# Max videoIds per add_playlist_items call; larger requests can drop items
+ADD_CHUNK = 50
+
+
 async def add_tracks_to_playlist(
     yt: YTMusic,
     playlist_id: str,
     video_ids: list[str],
 ) -> None:
-    """Add a list of videoIds to an existing playlist."""
-    if not video_ids:
-        return
-    await _run(lambda: yt.add_playlist_items(playlist_id, video_ids, duplicates=True))
+    """Add a list of videoIds to an existing playlist, ADD_CHUNK at a time."""
+    for i in range(0, len(video_ids), ADD_CHUNK):
+        chunk = video_ids[i : i + ADD_CHUNK]
+        await _run(lambda: yt.add_playlist_items(playlist_id, chunk, duplicates=True))